@@ -0,0 +1,157 @@
+"""语义响应缓存 (Semantic Response Cache).
+
+路由/分类类的 LLM 调用对语义相近的请求通常返回相同的结果，
+这里用嵌入向量 + 余弦相似度做一层语义缓存：命中时直接返回
+缓存的响应，省掉一次完整的网络往返。
+
+缓存键为 (system_prompt 哈希, 归一化后的用户消息)，向量存放在
+内存中的 numpy 矩阵里（内积即余弦相似度，向量已归一化）。
+"""
+
+import hashlib
+import os
+import re
+import string
+from collections import OrderedDict
+
+import numpy as np
+from langchain_openai import OpenAIEmbeddings
+
+# 相似度阈值：高于该值认为两个请求语义等价
+SIMILARITY_THRESHOLD = 0.92
+
+_PUNCT_RE = re.compile("[%s]+" % re.escape(string.punctuation))
+_WS_RE = re.compile(r"\s+")
+
+# 嵌入模型（OpenAI 兼容接口），首次使用时才构建：
+# 缺少 OPENAI_API_KEY 时 OpenAIEmbeddings 构造即抛错，惰性化保证
+# 导入不受影响，调用方的 except 兜底才能生效并退回 LLM 路由
+_embeddings = None
+
+
+def _get_embeddings() -> OpenAIEmbeddings:
+    global _embeddings
+    if _embeddings is None:
+        _embeddings = OpenAIEmbeddings(
+            model="text-embedding-3-small",
+            api_key=os.getenv('OPENAI_API_KEY')
+        )
+    return _embeddings
+
+
+def normalize_query(text: str) -> str:
+    """归一化查询：小写、去标点、压缩空白"""
+    text = _PUNCT_RE.sub(" ", text.lower())
+    return _WS_RE.sub(" ", text).strip()
+
+
+# 嵌入向量的进程内记忆化：同一轮里语义缓存查询和路由分类会对同一条
+# 归一化文本各嵌入一次，这里按文本做 LRU 复用，同步/异步路径共享
+_EMBED_CACHE_SIZE = 128
+_embed_cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+
+# 简单计数器，用于观测每轮实际发出的嵌入请求数
+embed_requests = 0
+embed_cache_hits = 0
+
+
+def _embed_cache_get(text: str):
+    global embed_requests, embed_cache_hits
+    embed_requests += 1
+    vector = _embed_cache.get(text)
+    if vector is not None:
+        embed_cache_hits += 1
+        _embed_cache.move_to_end(text)
+    return vector
+
+
+def _embed_cache_put(text: str, vector: np.ndarray):
+    _embed_cache[text] = vector
+    if len(_embed_cache) > _EMBED_CACHE_SIZE:
+        _embed_cache.popitem(last=False)
+
+
+def embed_stats() -> dict:
+    """返回嵌入调用统计（请求数/命中数），用于观测每轮嵌入次数"""
+    return {"requests": embed_requests, "cache_hits": embed_cache_hits}
+
+
+def embed_text(text: str) -> np.ndarray:
+    """把文本嵌入为归一化向量（内积即余弦相似度），带记忆化"""
+    vector = _embed_cache_get(text)
+    if vector is None:
+        vector = np.asarray(_get_embeddings().embed_query(text), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        vector = vector / norm if norm else vector
+        _embed_cache_put(text, vector)
+    return vector
+
+
+async def aembed_text(text: str) -> np.ndarray:
+    """embed_text 的异步版本，不阻塞事件循环，与同步路径共享缓存"""
+    vector = _embed_cache_get(text)
+    if vector is None:
+        vector = np.asarray(await _get_embeddings().aembed_query(text), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        vector = vector / norm if norm else vector
+        _embed_cache_put(text, vector)
+    return vector
+
+
+class SemanticCache:
+    """按 (system_prompt 哈希, 归一化用户消息) 缓存 LLM 响应"""
+
+    def __init__(self, threshold=SIMILARITY_THRESHOLD):
+        self.threshold = threshold
+        self._vectors = {}    # prompt_hash -> [向量, ...]
+        self._responses = {}  # prompt_hash -> [响应, ...]
+
+    @staticmethod
+    def _prompt_hash(system_prompt: str) -> str:
+        return hashlib.sha256(system_prompt.encode("utf-8")).hexdigest()
+
+    def get_or_compute(self, system_prompt: str, user_text: str, compute):
+        """缓存命中时直接返回缓存的响应，否则调用 compute() 并写入缓存"""
+        key = self._prompt_hash(system_prompt)
+        try:
+            query_vector = embed_text(normalize_query(user_text))
+        except Exception:
+            # 嵌入服务不可用时直接退回原始调用，不影响主流程
+            return compute()
+
+        vectors = self._vectors.get(key)
+        if vectors:
+            similarities = np.stack(vectors) @ query_vector
+            best = int(np.argmax(similarities))
+            if similarities[best] >= self.threshold:
+                return self._responses[key][best]
+
+        response = compute()
+        self._vectors.setdefault(key, []).append(query_vector)
+        self._responses.setdefault(key, []).append(response)
+        return response
+
+    async def aget_or_compute(self, system_prompt: str, user_text: str, compute):
+        """get_or_compute 的异步版本，compute 需返回可等待对象"""
+        key = self._prompt_hash(system_prompt)
+        try:
+            query_vector = await aembed_text(normalize_query(user_text))
+        except Exception:
+            # 嵌入服务不可用时直接退回原始调用，不影响主流程
+            return await compute()
+
+        vectors = self._vectors.get(key)
+        if vectors:
+            similarities = np.stack(vectors) @ query_vector
+            best = int(np.argmax(similarities))
+            if similarities[best] >= self.threshold:
+                return self._responses[key][best]
+
+        response = await compute()
+        self._vectors.setdefault(key, []).append(query_vector)
+        self._responses.setdefault(key, []).append(response)
+        return response
+
+
+# 路由/分类调用共享的全局缓存实例
+router_cache = SemanticCache()
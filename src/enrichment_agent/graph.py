@@ -3,54 +3,52 @@
 Works with a chat model with tool calling support.
 """
 
-import os
+import logging
+import re
+from typing import Literal
+
+from pydantic import BaseModel
+
 from langchain.agents import create_react_agent
 from langchain_core.messages import AIMessage
 from langgraph.graph import StateGraph, START, END
-from langchain_openai import ChatOpenAI
+from langgraph.checkpoint.memory import MemorySaver
 from enrichment_agent.tools import python_repl, web_search  # , add_sale, delete_sale, update_sale, query_sales  # SQL工具暂时注释
 from enrichment_agent.state import AgentState
-# TypedDict 和 Literal 导入已移除，不再需要结构化输出
-
+from enrichment_agent.cache import router_cache
+from enrichment_agent.llm import router_llm, shared_llm
+from enrichment_agent.routing import CONFIDENCE_THRESHOLD, EmbeddingRouter
 
-# 用于普通问答对话
-chat_llm = ChatOpenAI(model="deepseek-chat",
-                   api_key=os.getenv('DEEPSEEK_API_KEY'),
-                   base_url='https://api.deepseek.com')
-
-# 用于数据库检索
-db_llm = ChatOpenAI(model="deepseek-chat",
-                   api_key=os.getenv('DEEPSEEK_API_KEY'),
-                   base_url='https://api.deepseek.com')
-
-# 用于代码生成和执行代码
-coder_llm = ChatOpenAI(model="deepseek-chat",
-                   api_key=os.getenv('DEEPSEEK_API_KEY'),
-                   base_url='https://api.deepseek.com')
+logger = logging.getLogger(__name__)
 
 
 # 创建 模型
 # db_agent = create_react_agent(
-#     db_llm,
+#     shared_llm,
 #     tools=[add_sale, delete_sale, update_sale, query_sales],
 #     state_modifier="You use to perform database operations while should provide accurate data for the code_generator to use"
 # )
 
 search_agent = create_react_agent(
-    chat_llm,
+    shared_llm,
     tools=[web_search]
 )
 
 code_agent = create_react_agent(
-    coder_llm,
+    shared_llm,
     tools=[python_repl]
 )
 
 # 创建普通对话问答节点
-def chat(state: AgentState):
+async def chat(state: AgentState):
     messages = state["messages"]
-    model_response = chat_llm.invoke(messages)
-    final_response = [AIMessage(content=model_response.content, name="chatbot")]
+    # 流式生成：逐块累积。配合 graph.astream(..., stream_mode="messages")
+    # 消费端可以边生成边展示，首 token 延迟不再等于整段生成时间
+    content = ""
+    async for chunk in shared_llm.astream(messages):
+        if isinstance(chunk.content, str):
+            content += chunk.content
+    final_response = [AIMessage(content=content, name="chatbot")]
     return {"messages": final_response}
 
 # 创建执行数据库操作节点（暂时注释）
@@ -63,8 +61,8 @@ def chat(state: AgentState):
 #     }
 
 # 创建信息检索节点
-def search_node(state: AgentState):
-    result = search_agent.invoke(state)
+async def search_node(state: AgentState):
+    result = await search_agent.ainvoke(state)
     return {
         "messages": [
             AIMessage(content=result["messages"][-1].content, name="searcher")
@@ -72,8 +70,8 @@ def search_node(state: AgentState):
     }
 
 # 创建代码执行节点
-def code_node(state: AgentState):
-    result = code_agent.invoke(state)
+async def code_node(state: AgentState):
+    result = await code_agent.ainvoke(state)
     return {
         "messages": [AIMessage(content=result["messages"][-1].content, name="coder")]
     }
@@ -84,11 +82,42 @@ def code_node(state: AgentState):
 members = ["chat", "coder", "searcher"]  # 替换sqler为searcher
 options = members + ["FINISH"]
 
+# 本地嵌入路由器：用标签描述向量的 argmax 替代路由 LLM 调用
+worker_router = EmbeddingRouter({
+    "searcher": "internet search, news, weather, finding current information on the web",
+    "coder": "programming, charts, calculation, data analysis, code execution",
+    "chat": "general conversation, questions that can be answered with existing knowledge",
+})
+
+# 备用关键词匹配的预编译模式：一次 DFA 扫描替代逐个关键词的子串搜索
+SEARCH_PATTERN = re.compile(r"搜索|查找|上网|网上|搜|最新|新闻|search|find|latest|news|google|百度", re.IGNORECASE)
+CODE_PATTERN = re.compile(r"代码|编程|计算|图表|数据|画图|code|python|chart|plot|calculate|draw", re.IGNORECASE)
+
+
+class RouteChoice(BaseModel):
+    """路由器的结构化输出：下一个 worker 或 FINISH"""
+    next: Literal["searcher", "coder", "chat", "FINISH"]
+
+
+# 结构化路由：函数调用直接返回合法选项，不再解析自由文本，
+# 模型忘写/写错选项时不会再悄悄落到 FINISH
+structured_router = router_llm.with_structured_output(RouteChoice)
+
+# 回答疑似不完整的信号：出现这些措辞时才升级到 LLM 判断是否结束
+INCOMPLETE_PATTERN = re.compile(r"更多信息|还需要|待补充|未完成|need more|more information|to be continued", re.IGNORECASE)
 
-# Router类已移除，改用文本输出方式
 
+def _looks_incomplete(content: str) -> bool:
+    """粗略判断 worker 的回答是否被截断或自述需要更多信息"""
+    if not content:
+        return True
+    if INCOMPLETE_PATTERN.search(content):
+        return True
+    # 以逗号/冒号/连接符收尾，疑似生成中途被截断
+    return content.endswith(("，", ",", "：", ":", "、", "-", "（", "("))
 
-def supervisor(state: AgentState):
+
+async def supervisor(state: AgentState):
     messages = state["messages"]
     
     # 如果没有消息，开始对话
@@ -100,8 +129,13 @@ def supervisor(state: AgentState):
     
     # 如果最后一条消息是AI回复，检查是否需要继续对话
     if hasattr(last_message, 'name') and last_message.name in ['chatbot', 'searcher', 'coder']:
-        # 检查对话是否已经完成
-        # 如果用户的问题已经得到回答，结束对话
+        # 常见情形短路：worker 已经给出完整回答时直接结束，
+        # 不再为“是否结束”发起一次 LLM 调用
+        worker_answer = str(last_message.content).strip()
+        if not _looks_incomplete(worker_answer):
+            return {"next": END}
+
+        # 回答疑似不完整时才用 LLM 判断对话是否已经完成
         system_prompt = (
             "You are a supervisor. Review the conversation and determine if the user's question has been adequately answered.\n"
             "If the answer is complete and satisfactory, respond with 'FINISH'.\n"
@@ -120,21 +154,29 @@ def supervisor(state: AgentState):
             conversation_summary.append({"role": role, "content": str(msg.content)})
         
         analysis_messages = [{"role": "system", "content": system_prompt}] + conversation_summary
-        
-        response = db_llm.invoke(analysis_messages)
-        next_ = response.content.strip().upper()
-        
-        if next_ in ["CHAT", "CODER", "SEARCHER"]:
-            next_ = next_.lower()
-        elif next_ == "FINISH":
-            next_ = END
-        else:
-            # 如果回答已经完整，结束对话
+
+        # 语义缓存：相似的对话收尾判断直接复用缓存结果，省一次LLM调用
+        cache_text = "\n".join(msg["content"] for msg in conversation_summary)
+        try:
+            decision = await router_cache.aget_or_compute(
+                system_prompt, cache_text, lambda: structured_router.ainvoke(analysis_messages)
+            )
+            next_ = END if decision.next == "FINISH" else decision.next
+        except Exception:
+            # 结构化输出被截断/解析失败时不让异常冲出节点：
+            # worker 已经给出回答，按完成处理（与旧自由文本路径的兜底一致）
+            logger.debug("结构化收尾判断失败，按 FINISH 处理", exc_info=True)
             next_ = END
     else:
-        # 如果是用户消息，使用LLM来选择合适的worker
+        # 如果是用户消息，先用本地嵌入分类器选择worker
         user_message = str(last_message.content)
-        
+
+        next_, confidence = await worker_router.aclassify(user_message)
+        if next_ is not None and confidence >= CONFIDENCE_THRESHOLD:
+            logger.debug("嵌入分类器选择 %s (置信度 %.2f)", next_, confidence)
+            return {"next": next_}
+
+        # 置信度不足时退回LLM路由
         system_prompt = (
             "You are a task router. Based on the user's request, choose the most appropriate worker:\n"
             "- searcher: For internet searches, finding current information, news, weather, or any request that needs web search\n"
@@ -148,28 +190,37 @@ def supervisor(state: AgentState):
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": f"User request: {user_message}"}
         ]
-        response = db_llm.invoke(router_messages)
-        next_ = response.content.strip().lower()
+        # 语义缓存：相似的用户请求直接复用之前的路由结果
+        try:
+            decision = await router_cache.aget_or_compute(
+                system_prompt, user_message, lambda: structured_router.ainvoke(router_messages)
+            )
+            next_ = decision.next
+        except Exception:
+            # 结构化输出被截断/解析失败时不让异常冲出节点，
+            # 置 None 落到下面的关键词兜底
+            logger.debug("结构化路由失败，落到关键词兜底", exc_info=True)
+            next_ = None
         
-        # 添加调试日志
-        print(f"DEBUG: User message: {user_message}")
-        print(f"DEBUG: LLM选择的agent: {next_}")
+        # 调试日志用惰性 %s 格式化，日志关闭时不构造字符串
+        logger.debug("User message: %s", user_message)
+        logger.debug("LLM选择的agent: %s", next_)
         
         # 验证返回的选择是否有效
         if next_ not in members:
-            print(f"DEBUG: LLM返回无效选择 '{next_}', 使用备用关键词匹配")
+            logger.debug("LLM返回无效选择 '%s', 使用备用关键词匹配", next_)
             # 备用关键词匹配
-            if any(keyword in user_message.lower() for keyword in ['搜索', '查找', '上网', '网上', '搜', '最新', '新闻', 'search', 'find', 'latest', 'news', 'google', '百度']):
+            if SEARCH_PATTERN.search(user_message):
                 next_ = "searcher"
-                print(f"DEBUG: 关键词匹配选择 searcher")
-            elif any(keyword in user_message.lower() for keyword in ['代码', '编程', '计算', '图表', '数据', '画图', 'code', 'python', 'chart', 'plot', 'calculate', 'draw']):
-                next_ = "coder" 
-                print(f"DEBUG: 关键词匹配选择 coder")
+                logger.debug("关键词匹配选择 searcher")
+            elif CODE_PATTERN.search(user_message):
+                next_ = "coder"
+                logger.debug("关键词匹配选择 coder")
             else:
                 next_ = "chat"
-                print(f"DEBUG: 默认选择 chat")
+                logger.debug("默认选择 chat")
         else:
-            print(f"DEBUG: LLM有效选择: {next_}")
+            logger.debug("LLM有效选择: %s", next_)
     
     return {"next": next_}
 
@@ -195,7 +246,12 @@ workflow.add_conditional_edges(
 )
 
 # 编译图
-graph = workflow.compile()
+# 消费端用 graph.astream(inputs, config, stream_mode="messages") 可以
+# 逐 token 接收生成节点的输出；路由节点输出极短，保持单次返回。
+# 持久化状态：消息历史按 thread_id 追加而不是每轮重建，
+# 保证提示前缀逐字节稳定，服务端 KV/前缀缓存才能持续命中。
+# 调用时传 config={"configurable": {"thread_id": 会话ID}}
+graph = workflow.compile(checkpointer=MemorySaver())
 
 graph.name = "multi-Agent"
 
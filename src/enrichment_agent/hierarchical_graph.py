@@ -12,35 +12,90 @@
 - 可扩展：容易添加新的团队和代理
 """
 
-import os
 from typing import Literal, List, Dict, Any
 
+from pydantic import BaseModel
+
 from langchain.agents import create_react_agent
 
-from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.messages import AIMessage, HumanMessage, trim_messages
 from langgraph.graph import StateGraph, START, END
-from langchain_openai import ChatOpenAI
+from langgraph.checkpoint.memory import MemorySaver
 from enrichment_agent.tools import python_repl, web_search
 from enrichment_agent.state import AgentState
+from enrichment_agent.cache import router_cache
+from enrichment_agent.llm import shared_llm
+from enrichment_agent.routing import CONFIDENCE_THRESHOLD, EmbeddingRouter
+
+# 本地嵌入路由器：团队/成员分配先走嵌入分类，置信度不足再退回 LLM
+team_router = EmbeddingRouter({
+    "research_team": "理论研究、文献调查、概念分析、信息收集",
+    "analysis_team": "数据分析、统计计算、数据可视化、图表制作",
+    "execution_team": "编程实现、代码开发、测试部署、系统开发",
+})
+
+research_member_router = EmbeddingRouter({
+    "researcher": "理论分析和学术研究",
+    "searcher": "网络搜索和信息收集",
+    "data_collector": "数据收集和整理",
+})
+
+analysis_member_router = EmbeddingRouter({
+    "analyst": "数据分析和模式识别",
+    "calculator": "数学计算和统计分析",
+    "visualizer": "数据可视化和图表制作",
+})
+
+execution_member_router = EmbeddingRouter({
+    "coder": "编程和代码实现",
+    "tester": "测试和质量保证",
+    "deployer": "部署和运维",
+})
+
+# 各团队的成员花名册，用于计划校验和路由
+TEAM_MEMBERS = {
+    "research_team": ("researcher", "searcher", "data_collector"),
+    "analysis_team": ("analyst", "calculator", "visualizer"),
+    "execution_team": ("coder", "tester", "deployer"),
+}
+
+_MEMBER_ROUTERS = {
+    "research_team": research_member_router,
+    "analysis_team": analysis_member_router,
+    "execution_team": execution_member_router,
+}
+
+
+class PlanDecision(BaseModel):
+    """一次性给出团队与成员分配的计划"""
+    team: Literal["research_team", "analysis_team", "execution_team"]
+    worker: Literal["researcher", "searcher", "data_collector",
+                    "analyst", "calculator", "visualizer",
+                    "coder", "tester", "deployer"]
+
+
+# 计划代理：一次结构化输出同时给出团队和成员，替代 2-4 次串行路由调用
+plan_agent = shared_llm.with_structured_output(PlanDecision)
+
+PLAN_PROMPT = """
+作为顶层监督者，你需要分析用户的请求，一次性决定由哪个团队的哪位成员来处理：
+
+可选的团队和成员：
+- research_team（理论研究、文献调查、概念分析）：researcher, searcher, data_collector
+- analysis_team（数据分析、统计计算、可视化）：analyst, calculator, visualizer
+- execution_team（编程实现、测试部署、系统开发）：coder, tester, deployer
+
+请给出团队名称和成员名称。
+"""
 
 
-# 创建LLM实例
-hierarchical_llm = ChatOpenAI(
-    model="deepseek-chat",
-    api_key=os.getenv('DEEPSEEK_API_KEY'),
-    base_url='https://api.deepseek.com'
-)
-
 # ============================================================================
-# 第三层：专业代理（底层执行者）
+# 专业代理的系统提示（模块级常量）
+# 提示内容保持字节级一致且始终作为第一条消息，这样服务端的
+# 自动前缀缓存（prompt caching）才能在每次调用间命中
 # ============================================================================
 
-def researcher_agent(state: AgentState):
-    """研究员代理 - 负责文献研究和理论分析"""
-    messages = state["messages"]
-    
-    # 专业研究提示
-    research_prompt = """
+RESEARCH_PROMPT = """
     你是一个专业的研究员。你的任务是：
     1. 进行深入的理论分析
     2. 查找相关文献和资料
@@ -48,144 +103,168 @@ def researcher_agent(state: AgentState):
     
     请基于用户的需求进行专业的研究分析。
     """
+
+DATA_PROMPT = """
+    你是一个数据收集专家。你的任务是：
+    1. 识别需要收集的数据类型
+    2. 制定数据收集计划
+    3. 整理和清洗数据
+    
+    请根据用户需求制定数据收集方案。
+    """
+
+ANALYSIS_PROMPT = """
+    你是一个专业分析师。你的任务是：
+    1. 分析数据中的模式和趋势
+    2. 提供深入的洞察和解释
+    3. 识别关键发现和异常
+    
+    请对提供的信息进行专业分析。
+    """
+
+VIZ_PROMPT = """
+    你是一个可视化专家。你的任务是：
+    1. 设计合适的图表类型
+    2. 创建清晰的数据可视化
+    3. 提供图表解释说明
+    
+    请根据数据特点设计最佳的可视化方案。
+    """
+
+TEST_PROMPT = """
+    你是一个专业测试工程师。你的任务是：
+    1. 设计测试方案和测试用例
+    2. 执行功能测试和性能测试
+    3. 识别问题和提供改进建议
+    
+    请制定全面的测试计划。
+    """
+
+DEPLOY_PROMPT = """
+    你是一个部署工程师。你的任务是：
+    1. 制定部署计划和策略
+    2. 配置生产环境
+    3. 监控系统运行状态
     
-    enhanced_messages = [{"role": "system", "content": research_prompt}] + [
-        {"role": "user" if not hasattr(msg, 'name') else "assistant", 
-         "content": str(msg.content)} for msg in messages
+    请提供详细的部署方案。
+    """
+
+
+# 工具代理在模块加载时构建一次（graph.py 的扁平版已是这种写法），
+# 避免每次节点调用都重新绑定工具、重编 react 提示
+_search_react_agent = create_react_agent(shared_llm, tools=[web_search])
+_calc_react_agent = create_react_agent(shared_llm, tools=[python_repl])
+_code_react_agent = create_react_agent(shared_llm, tools=[python_repl])
+
+_MISSING = object()
+
+# 滚动窗口：重新提示时只带上最近这些消息。按消息条数截断
+# （token_counter=len 把每条消息计为 1），长会话的输入 token
+# 不再随轮数线性膨胀
+HISTORY_WINDOW = 12
+
+
+def _history_to_openai_messages(messages):
+    """把消息历史序列化成 OpenAI 格式，供各专业代理共用.
+
+    用带哨兵的 getattr 保持与 hasattr 相同的语义但只做一次属性查找；
+    content 已经是 str 时跳过 str() 转换。消息列表在每次节点调用间
+    都是新对象（且 list 不支持弱引用），所以不做跨调用的记忆化，
+    共用一个实现本身就消除了 6 份重复的序列化代码。
+    """
+    messages = trim_messages(
+        messages,
+        strategy="last",
+        token_counter=len,
+        max_tokens=HISTORY_WINDOW,
+        include_system=True,
+    )
+    return [
+        {"role": "user" if getattr(msg, 'name', _MISSING) is _MISSING else "assistant",
+         "content": msg.content if isinstance(msg.content, str) else str(msg.content)}
+        for msg in messages
     ]
+
+
+# ============================================================================
+# 第三层：专业代理（底层执行者）
+# ============================================================================
+
+async def researcher_agent(state: AgentState):
+    """研究员代理 - 负责文献研究和理论分析"""
+    messages = state["messages"]
+    
+    enhanced_messages = [{"role": "system", "content": RESEARCH_PROMPT}] + _history_to_openai_messages(messages)
     
-    response = hierarchical_llm.invoke(enhanced_messages)
+    response = await shared_llm.ainvoke(enhanced_messages)
     return {"messages": [AIMessage(content=response.content, name="researcher")]}
 
 
-def searcher_agent(state: AgentState):
+async def searcher_agent(state: AgentState):
     """搜索员代理 - 使用搜索工具获取最新信息"""
-    search_agent = create_react_agent(hierarchical_llm, tools=[web_search])
-    result = search_agent.invoke(state)
+    result = await _search_react_agent.ainvoke(state)
     return {"messages": [AIMessage(content=result["messages"][-1].content, name="searcher")]}
 
 
-def data_collector_agent(state: AgentState):
+async def data_collector_agent(state: AgentState):
     """数据收集员代理 - 负责数据收集和整理"""
     messages = state["messages"]
     
-    data_prompt = """
-    你是一个数据收集专家。你的任务是：
-    1. 识别需要收集的数据类型
-    2. 制定数据收集计划
-    3. 整理和清洗数据
-    
-    请根据用户需求制定数据收集方案。
-    """
-    
-    enhanced_messages = [{"role": "system", "content": data_prompt}] + [
-        {"role": "user" if not hasattr(msg, 'name') else "assistant", 
-         "content": str(msg.content)} for msg in messages
-    ]
+    enhanced_messages = [{"role": "system", "content": DATA_PROMPT}] + _history_to_openai_messages(messages)
     
-    response = hierarchical_llm.invoke(enhanced_messages)
+    response = await shared_llm.ainvoke(enhanced_messages)
     return {"messages": [AIMessage(content=response.content, name="data_collector")]}
 
 
-def analyst_agent(state: AgentState):
+async def analyst_agent(state: AgentState):
     """分析员代理 - 进行数据分析和解释"""
     messages = state["messages"]
     
-    analysis_prompt = """
-    你是一个专业分析师。你的任务是：
-    1. 分析数据中的模式和趋势
-    2. 提供深入的洞察和解释
-    3. 识别关键发现和异常
-    
-    请对提供的信息进行专业分析。
-    """
-    
-    enhanced_messages = [{"role": "system", "content": analysis_prompt}] + [
-        {"role": "user" if not hasattr(msg, 'name') else "assistant", 
-         "content": str(msg.content)} for msg in messages
-    ]
+    enhanced_messages = [{"role": "system", "content": ANALYSIS_PROMPT}] + _history_to_openai_messages(messages)
     
-    response = hierarchical_llm.invoke(enhanced_messages)
+    response = await shared_llm.ainvoke(enhanced_messages)
     return {"messages": [AIMessage(content=response.content, name="analyst")]}
 
 
-def calculator_agent(state: AgentState):
+async def calculator_agent(state: AgentState):
     """计算员代理 - 使用代码进行计算"""
-    calc_agent = create_react_agent(hierarchical_llm, tools=[python_repl])
-    result = calc_agent.invoke(state)
+    result = await _calc_react_agent.ainvoke(state)
     return {"messages": [AIMessage(content=result["messages"][-1].content, name="calculator")]}
 
 
-def visualizer_agent(state: AgentState):
+async def visualizer_agent(state: AgentState):
     """图表员代理 - 创建可视化图表"""
     messages = state["messages"]
     
-    viz_prompt = """
-    你是一个可视化专家。你的任务是：
-    1. 设计合适的图表类型
-    2. 创建清晰的数据可视化
-    3. 提供图表解释说明
-    
-    请根据数据特点设计最佳的可视化方案。
-    """
-    
-    enhanced_messages = [{"role": "system", "content": viz_prompt}] + [
-        {"role": "user" if not hasattr(msg, 'name') else "assistant", 
-         "content": str(msg.content)} for msg in messages
-    ]
+    enhanced_messages = [{"role": "system", "content": VIZ_PROMPT}] + _history_to_openai_messages(messages)
     
-    response = hierarchical_llm.invoke(enhanced_messages)
+    response = await shared_llm.ainvoke(enhanced_messages)
     return {"messages": [AIMessage(content=response.content, name="visualizer")]}
 
 
-def coder_agent(state: AgentState):
+async def coder_agent(state: AgentState):
     """代码员代理 - 编写和执行代码"""
-    code_agent = create_react_agent(hierarchical_llm, tools=[python_repl])
-    result = code_agent.invoke(state)
+    result = await _code_react_agent.ainvoke(state)
     return {"messages": [AIMessage(content=result["messages"][-1].content, name="coder")]}
 
 
-def tester_agent(state: AgentState):
+async def tester_agent(state: AgentState):
     """测试员代理 - 进行测试和验证"""
     messages = state["messages"]
     
-    test_prompt = """
-    你是一个专业测试工程师。你的任务是：
-    1. 设计测试方案和测试用例
-    2. 执行功能测试和性能测试
-    3. 识别问题和提供改进建议
+    enhanced_messages = [{"role": "system", "content": TEST_PROMPT}] + _history_to_openai_messages(messages)
     
-    请制定全面的测试计划。
-    """
-    
-    enhanced_messages = [{"role": "system", "content": test_prompt}] + [
-        {"role": "user" if not hasattr(msg, 'name') else "assistant", 
-         "content": str(msg.content)} for msg in messages
-    ]
-    
-    response = hierarchical_llm.invoke(enhanced_messages)
+    response = await shared_llm.ainvoke(enhanced_messages)
     return {"messages": [AIMessage(content=response.content, name="tester")]}
 
 
-def deployer_agent(state: AgentState):
+async def deployer_agent(state: AgentState):
     """部署员代理 - 负责部署和上线"""
     messages = state["messages"]
     
-    deploy_prompt = """
-    你是一个部署工程师。你的任务是：
-    1. 制定部署计划和策略
-    2. 配置生产环境
-    3. 监控系统运行状态
-    
-    请提供详细的部署方案。
-    """
-    
-    enhanced_messages = [{"role": "system", "content": deploy_prompt}] + [
-        {"role": "user" if not hasattr(msg, 'name') else "assistant", 
-         "content": str(msg.content)} for msg in messages
-    ]
+    enhanced_messages = [{"role": "system", "content": DEPLOY_PROMPT}] + _history_to_openai_messages(messages)
     
-    response = hierarchical_llm.invoke(enhanced_messages)
+    response = await shared_llm.ainvoke(enhanced_messages)
     return {"messages": [AIMessage(content=response.content, name="deployer")]}
 
 
@@ -193,33 +272,16 @@ def deployer_agent(state: AgentState):
 # 第二层：团队监督者（中层管理）
 # ============================================================================
 
-def research_team_supervisor(state: AgentState):
+async def research_team_supervisor(state: AgentState):
     """研究团队监督者 - 管理研究团队的工作分配"""
     messages = state["messages"]
     last_message = messages[-1] if messages else None
     
     # 如果来自顶层监督者的任务分配
     if hasattr(last_message, 'name') and last_message.name == "top_supervisor":
-        task_content = str(last_message.content)
-        
-        # 分析任务类型，选择合适的研究团队成员
-        decision_prompt = f"""
-        作为研究团队的监督者，你需要分析以下任务并选择最合适的团队成员执行：
-
-        任务内容：{task_content}
-
-        可选的团队成员：
-        - researcher: 擅长理论分析和学术研究
-        - searcher: 擅长网络搜索和信息收集  
-        - data_collector: 擅长数据收集和整理
-
-        请选择一个最适合的成员，只回复成员名称：researcher, searcher, 或 data_collector
-        """
-        
-        response = hierarchical_llm.invoke([{"role": "system", "content": decision_prompt}])
-        choice = response.content.strip().lower()
-        
-        if choice not in ["researcher", "searcher", "data_collector"]:
+        # 直接读取顶层监督者的计划，不再发起本团队自己的路由 LLM 调用
+        choice = (state.get("plan") or {}).get("worker")
+        if choice not in TEAM_MEMBERS["research_team"]:
             choice = "researcher"  # 默认选择
             
         return {
@@ -234,32 +296,16 @@ def research_team_supervisor(state: AgentState):
         }
 
 
-def analysis_team_supervisor(state: AgentState):
+async def analysis_team_supervisor(state: AgentState):
     """分析团队监督者 - 管理分析团队的工作分配"""
     messages = state["messages"]
     last_message = messages[-1] if messages else None
     
     if hasattr(last_message, 'name') and last_message.name == "top_supervisor":
-        task_content = str(last_message.content)
-        
-        decision_prompt = f"""
-        作为分析团队的监督者，你需要分析以下任务并选择最合适的团队成员执行：
-
-        任务内容：{task_content}
-
-        可选的团队成员：
-        - analyst: 擅长数据分析和模式识别
-        - calculator: 擅长数学计算和统计分析
-        - visualizer: 擅长数据可视化和图表制作
-
-        请选择一个最适合的成员，只回复成员名称：analyst, calculator, 或 visualizer
-        """
-        
-        response = hierarchical_llm.invoke([{"role": "system", "content": decision_prompt}])
-        choice = response.content.strip().lower()
-        
-        if choice not in ["analyst", "calculator", "visualizer"]:
-            choice = "analyst"
+        # 直接读取顶层监督者的计划，不再发起本团队自己的路由 LLM 调用
+        choice = (state.get("plan") or {}).get("worker")
+        if choice not in TEAM_MEMBERS["analysis_team"]:
+            choice = "analyst"  # 默认选择
             
         return {
             "messages": [AIMessage(content=f"分析团队接收任务，分配给{choice}", name="analysis_supervisor")],
@@ -272,32 +318,16 @@ def analysis_team_supervisor(state: AgentState):
         }
 
 
-def execution_team_supervisor(state: AgentState):
+async def execution_team_supervisor(state: AgentState):
     """执行团队监督者 - 管理执行团队的工作分配"""
     messages = state["messages"]
     last_message = messages[-1] if messages else None
     
     if hasattr(last_message, 'name') and last_message.name == "top_supervisor":
-        task_content = str(last_message.content)
-        
-        decision_prompt = f"""
-        作为执行团队的监督者，你需要分析以下任务并选择最合适的团队成员执行：
-
-        任务内容：{task_content}
-
-        可选的团队成员：
-        - coder: 擅长编程和代码实现
-        - tester: 擅长测试和质量保证
-        - deployer: 擅长部署和运维
-
-        请选择一个最适合的成员，只回复成员名称：coder, tester, 或 deployer
-        """
-        
-        response = hierarchical_llm.invoke([{"role": "system", "content": decision_prompt}])
-        choice = response.content.strip().lower()
-        
-        if choice not in ["coder", "tester", "deployer"]:
-            choice = "coder"
+        # 直接读取顶层监督者的计划，不再发起本团队自己的路由 LLM 调用
+        choice = (state.get("plan") or {}).get("worker")
+        if choice not in TEAM_MEMBERS["execution_team"]:
+            choice = "coder"  # 默认选择
             
         return {
             "messages": [AIMessage(content=f"执行团队接收任务，分配给{choice}", name="execution_supervisor")],
@@ -314,39 +344,43 @@ def execution_team_supervisor(state: AgentState):
 # 第一层：顶层监督者（最高层决策）
 # ============================================================================
 
-def top_level_supervisor(state: AgentState):
-    """顶层监督者 - 分析任务并分配给合适的团队"""
+async def top_level_supervisor(state: AgentState):
+    """顶层监督者 - 一次规划同时决定团队和成员"""
     messages = state["messages"]
     user_input = str(messages[-1].content) if messages else ""
-    
-    # 分析用户请求，决定分配给哪个团队
-    decision_prompt = f"""
-    作为顶层监督者，你需要分析用户的请求并决定分配给哪个专业团队：
-
-    用户请求：{user_input}
-
-    可选的团队：
-    - research_team: 适合理论研究、文献调查、概念分析等任务
-    - analysis_team: 适合数据分析、统计计算、可视化等任务  
-    - execution_team: 适合编程实现、测试部署、系统开发等任务
 
-    请分析任务特点并选择最适合的团队，只回复团队名称：research_team, analysis_team, 或 execution_team
-    """
-    
-    response = hierarchical_llm.invoke([{"role": "system", "content": decision_prompt}])
-    team_choice = response.content.strip().lower()
-    
-    # 验证选择的有效性
-    valid_teams = ["research_team", "analysis_team", "execution_team"]
-    if team_choice not in valid_teams:
+    # 先用本地嵌入分类器规划：团队 + 团队内成员，全程零 LLM 调用
+    team_choice, confidence = await team_router.aclassify(user_input)
+    worker_choice = None
+    if team_choice is not None and confidence >= CONFIDENCE_THRESHOLD:
+        worker_choice, worker_confidence = await _MEMBER_ROUTERS[team_choice].aclassify(user_input)
+        if worker_choice is None or worker_confidence < CONFIDENCE_THRESHOLD:
+            worker_choice = None
+
+    # 置信度不足时，用一次结构化输出的 LLM 调用同时拿到团队和成员，
+    # 替代原来“顶层路由 + 团队路由”的 2 次串行调用
+    if worker_choice is None:
+        plan = await router_cache.aget_or_compute(
+            PLAN_PROMPT, user_input,
+            lambda: plan_agent.ainvoke([
+                {"role": "system", "content": PLAN_PROMPT},
+                {"role": "user", "content": user_input}
+            ])
+        )
+        team_choice, worker_choice = plan.team, plan.worker
+
+    # 验证计划的有效性
+    if worker_choice not in TEAM_MEMBERS.get(team_choice, ()):
         team_choice = "research_team"  # 默认选择研究团队
-    
+        worker_choice = "researcher"
+
     # 生成任务分配消息
     task_message = f"顶层监督者分析用户需求：{user_input}，决定分配给{team_choice}团队处理"
-    
+
     return {
         "messages": [AIMessage(content=task_message, name="top_supervisor")],
-        "next": team_choice
+        "next": team_choice,
+        "plan": {"team": team_choice, "worker": worker_choice}
     }
 
 
@@ -439,19 +473,24 @@ def team_supervisor_router(state: AgentState):
     # 否则继续分配给专业代理
     return next_node
 
+# 团队监督者的报告名，用于判断流程是否已经走完一轮
+SUPERVISOR_NAMES = frozenset({"research_supervisor", "analysis_supervisor", "execution_supervisor"})
+
+
 # 顶层监督者最终路由器 - 决定是否结束整个流程
 def top_supervisor_final_router(state: AgentState):
     """顶层监督者最终路由器 - 决定是否结束整个流程"""
     messages = state.get("messages", [])
-    
-    # 检查是否有团队监督者的报告
-    supervisor_reports = [msg for msg in messages if hasattr(msg, 'name') and 
-                         msg.name in ["research_supervisor", "analysis_supervisor", "execution_supervisor"]]
-    
-    # 如果已有报告，结束流程
-    if supervisor_reports:
-        return END
-    
+
+    # 只需要知道“本轮是否已有监督者报告”：从尾部反向扫描，遇到最近
+    # 一条用户消息就停——复用 thread_id 时检查点里留着上一轮的报告，
+    # 扫完整个历史会让后续轮次在分配任务前就直接 END
+    for msg in reversed(messages):
+        if isinstance(msg, HumanMessage):
+            break
+        if getattr(msg, 'name', None) in SUPERVISOR_NAMES:
+            return END
+
     # 否则继续分配任务（初次分配）
     next_node = state.get("next", "research_team")
     return next_node
@@ -503,6 +542,6 @@ hierarchical_workflow.add_conditional_edges(
 )
 
 
-# 编译图
-hierarchical_graph = hierarchical_workflow.compile()
+# 编译图（带检查点，调用时传 thread_id 保持消息前缀稳定）
+hierarchical_graph = hierarchical_workflow.compile(checkpointer=MemorySaver())
 hierarchical_graph.name = "Hierarchical-Multi-Agent"
\ No newline at end of file
@@ -0,0 +1,47 @@
+"""共享 LLM 客户端 (Shared LLM Client).
+
+三个图原来各自实例化 ChatOpenAI，每个实例都带着自己的 httpx
+连接池，TCP/TLS 握手成本成倍增加。这里统一成一个模块级共享实例，
+同步/异步各一个连接池，所有图复用同一批长连接。
+
+任务相关的参数（temperature、max_tokens 等）请用 .bind(...) 绑定，
+不要再新建 ChatOpenAI 实例。唯一的例外是下面的 router_llm：
+with_structured_output 只能挂在真正的模型实例上（bind 返回的
+RunnableBinding 不支持），所以它是第二个实例，但仍共用同一对
+httpx 客户端，连接池不会因此翻倍。
+"""
+
+import os
+
+import httpx
+from langchain_openai import ChatOpenAI
+
+# 连接池：复用长连接，避免每个实例重复 TCP/TLS 握手
+_POOL_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=50)
+
+_sync_client = httpx.Client(limits=_POOL_LIMITS)
+_async_client = httpx.AsyncClient(limits=_POOL_LIMITS)
+
+# 所有图共享的 LLM 实例
+shared_llm = ChatOpenAI(
+    model="deepseek-chat",
+    api_key=os.getenv('DEEPSEEK_API_KEY'),
+    base_url='https://api.deepseek.com',
+    http_client=_sync_client,
+    http_async_client=_async_client,
+)
+
+# 路由/分类专用：解码上限压到结构化路由的函数调用 JSON 够用的量级
+# （函数名 + 参数键值对，比纯选项词多一截，压得太低会截断工具调用），
+# temperature=0 保证分类结果稳定。与 shared_llm 共用连接池。
+# 如有更便宜的 OpenAI 兼容端点（如本地小模型），在这里替换即可，
+# 生成类调用继续走 shared_llm。
+router_llm = ChatOpenAI(
+    model="deepseek-chat",
+    api_key=os.getenv('DEEPSEEK_API_KEY'),
+    base_url='https://api.deepseek.com',
+    temperature=0,
+    max_tokens=64,
+    http_client=_sync_client,
+    http_async_client=_async_client,
+)
@@ -4,47 +4,70 @@ This implements a decentralized approach where agents can communicate
 directly with each other without a central supervisor.
 """
 
-import os
+import re
+from typing import Literal
+
+from pydantic import BaseModel
+
 from langchain.agents import create_react_agent
 
 from langchain_core.messages import AIMessage
 from langgraph.graph import StateGraph, START, END
-from langchain_openai import ChatOpenAI
+from langgraph.checkpoint.memory import MemorySaver
 from enrichment_agent.tools import python_repl, web_search
 from enrichment_agent.state import AgentState
+from enrichment_agent.llm import shared_llm
+
+# 路由标签解析：一次正则扫描替代多次子串搜索和 replace
+ROUTE_RE = re.compile(r"\[ROUTE:(network_searcher|network_coder|network_chat|FINISH)\]")
+
 
+class RouteDecision(BaseModel):
+    """聊天代理的结构化输出：回复内容 + 下一步路由"""
+    next: Literal["network_searcher", "network_coder", "network_chat", "FINISH"]
+    content: str
 
-# 创建模型实例
-network_llm = ChatOpenAI(model="deepseek-chat",
-                        api_key=os.getenv('DEEPSEEK_API_KEY'),
-                        base_url='https://api.deepseek.com')
 
-# 创建代理
+# 结构化输出：回复和路由一次拿到，不再依赖模型记得写 [ROUTE:...] 标签
+route_chat_llm = shared_llm.with_structured_output(RouteDecision)
+
+# 创建代理：让代理在最终回答里自带路由标签，
+# 省掉每个节点原来额外的一次“决定下一步”LLM 调用
 network_search_agent = create_react_agent(
-    network_llm,
-    tools=[web_search]
+    shared_llm,
+    tools=[web_search],
+    state_modifier=(
+        "你是网络架构中的搜索代理。完成搜索并给出结果后，在回复末尾决定下一步：\n"
+        "- 如果结果需要进一步的代码分析或计算，添加 [ROUTE:network_coder]\n"
+        "- 如果需要与用户进行更多交流，添加 [ROUTE:network_chat]\n"
+        "- 如果任务已完成，添加 [ROUTE:FINISH]"
+    )
 )
 
 network_code_agent = create_react_agent(
-    network_llm,
-    tools=[python_repl]
+    shared_llm,
+    tools=[python_repl],
+    state_modifier=(
+        "你是网络架构中的代码代理。执行代码并给出结果后，在回复末尾决定下一步：\n"
+        "- 如果需要搜索更多信息，添加 [ROUTE:network_searcher]\n"
+        "- 如果需要与用户进行更多交流，添加 [ROUTE:network_chat]\n"
+        "- 如果任务已完成，添加 [ROUTE:FINISH]"
+    )
 )
 
 
-def network_chat_node(state: AgentState):
+async def network_chat_node(state: AgentState):
     """网络聊天节点 - 可以直接决定下一个节点"""
     messages = state["messages"]
     
     # 添加决策提示
     decision_prompt = """
     你是一个网络架构中的聊天代理。根据用户的请求，你需要：
-    1. 回答用户的问题
-    2. 决定是否需要调用其他代理协助
-    
-    如果需要其他代理协助：
-    - 如果需要搜索信息，在回复末尾添加 [ROUTE:network_searcher]
-    - 如果需要执行代码，在回复末尾添加 [ROUTE:network_coder]  
-    - 如果任务完成，在回复末尾添加 [ROUTE:FINISH]
+    1. 在 content 字段回答用户的问题
+    2. 在 next 字段决定是否需要调用其他代理协助：
+    - 如果需要搜索信息，选择 network_searcher
+    - 如果需要执行代码，选择 network_coder
+    - 如果任务完成，选择 FINISH
     """
     
     # 构建消息
@@ -53,51 +76,22 @@ def network_chat_node(state: AgentState):
          "content": str(msg.content)} for msg in messages
     ]
     
-    model_response = network_llm.invoke(enhanced_messages)
-    response_content = model_response.content
+    # 结构化输出同时给出回复和路由，省掉输出标签的 token 和解析
+    decision = await route_chat_llm.ainvoke(enhanced_messages)
     
-    # 解析路由决策
-    next_agent = "FINISH"
-    if "[ROUTE:network_searcher]" in response_content:
-        next_agent = "network_searcher"
-        response_content = response_content.replace("[ROUTE:network_searcher]", "")
-    elif "[ROUTE:network_coder]" in response_content:
-        next_agent = "network_coder"
-        response_content = response_content.replace("[ROUTE:network_coder]", "")
-    elif "[ROUTE:FINISH]" in response_content:
-        next_agent = "FINISH"
-        response_content = response_content.replace("[ROUTE:FINISH]", "")
-    
-    final_response = [AIMessage(content=response_content.strip(), name="network_chatbot")]
-    return {"messages": final_response, "next": next_agent}
+    final_response = [AIMessage(content=decision.content.strip(), name="network_chatbot")]
+    return {"messages": final_response, "next": decision.next}
 
 
-def network_search_node(state: AgentState):
+async def network_search_node(state: AgentState):
     """网络搜索节点 - 可以决定下一步行动"""
-    result = network_search_agent.invoke(state)
+    result = await network_search_agent.ainvoke(state)
     search_result = result["messages"][-1].content
     
-    # 搜索后的决策逻辑
-    decision_prompt = f"""
-    你刚完成了一次搜索，结果是：{search_result}
-    
-    现在决定下一步：
-    - 如果搜索结果需要进一步的代码分析或计算，在回复末尾添加 [ROUTE:network_coder]
-    - 如果需要与用户进行更多交流，在回复末尾添加 [ROUTE:network_chat]
-    - 如果任务已完成，在回复末尾添加 [ROUTE:FINISH]
-    """
-    
-    decision_response = network_llm.invoke([{"role": "system", "content": decision_prompt}])
-    decision_content = decision_response.content
-    
-    # 解析下一步
-    next_agent = "FINISH"
-    if "[ROUTE:network_coder]" in decision_content:
-        next_agent = "network_coder"
-    elif "[ROUTE:network_chat]" in decision_content:
-        next_agent = "network_chat"
-    elif "[ROUTE:FINISH]" in decision_content:
-        next_agent = "FINISH"
+    # 路由标签由代理在最终回答中自带，直接解析，省一次 LLM 调用
+    match = ROUTE_RE.search(search_result)
+    next_agent = match.group(1) if match else "FINISH"
+    search_result = ROUTE_RE.sub("", search_result).strip()
     
     return {
         "messages": [AIMessage(content=search_result, name="network_searcher")],
@@ -105,32 +99,15 @@ def network_search_node(state: AgentState):
     }
 
 
-def network_code_node(state: AgentState):
+async def network_code_node(state: AgentState):
     """网络代码节点 - 可以决定下一步行动"""
-    result = network_code_agent.invoke(state)
+    result = await network_code_agent.ainvoke(state)
     code_result = result["messages"][-1].content
     
-    # 代码执行后的决策逻辑
-    decision_prompt = f"""
-    你刚执行了代码，结果是：{code_result}
-    
-    现在决定下一步：
-    - 如果需要搜索更多信息，在回复末尾添加 [ROUTE:network_searcher]
-    - 如果需要与用户进行更多交流，在回复末尾添加 [ROUTE:network_chat]
-    - 如果任务已完成，在回复末尾添加 [ROUTE:FINISH]
-    """
-    
-    decision_response = network_llm.invoke([{"role": "system", "content": decision_prompt}])
-    decision_content = decision_response.content
-    
-    # 解析下一步
-    next_agent = "FINISH"
-    if "[ROUTE:network_searcher]" in decision_content:
-        next_agent = "network_searcher"
-    elif "[ROUTE:network_chat]" in decision_content:
-        next_agent = "network_chat"
-    elif "[ROUTE:FINISH]" in decision_content:
-        next_agent = "FINISH"
+    # 路由标签由代理在最终回答中自带，直接解析，省一次 LLM 调用
+    match = ROUTE_RE.search(code_result)
+    next_agent = match.group(1) if match else "FINISH"
+    code_result = ROUTE_RE.sub("", code_result).strip()
     
     return {
         "messages": [AIMessage(content=code_result, name="network_coder")],
@@ -193,6 +170,6 @@ network_workflow.add_conditional_edges(
     }
 )
 
-# 编译网络图
-network_graph = network_workflow.compile()
+# 编译网络图（带检查点，调用时传 thread_id 保持消息前缀稳定）
+network_graph = network_workflow.compile(checkpointer=MemorySaver())
 network_graph.name = "Network-Agent"
\ No newline at end of file
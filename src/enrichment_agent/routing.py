@@ -0,0 +1,52 @@
+"""本地嵌入路由器 (Embedding Router).
+
+监督者的路由本质上是分类而不是生成：把每个候选 worker 的描述
+预先嵌入成向量，运行时只需嵌入一次用户消息并做内积取 argmax，
+就能省掉一次完整的自回归 LLM 调用（百毫秒级 -> 毫秒级）。
+置信度低于阈值时退回原有的 LLM 路由。
+"""
+
+import numpy as np
+
+from enrichment_agent.cache import aembed_text, embed_text, normalize_query
+
+# 最高相似度低于该值时认为分类不可信，退回 LLM 路由
+CONFIDENCE_THRESHOLD = 0.3
+
+
+class EmbeddingRouter:
+    """用标签描述的嵌入向量做 argmax 分类的本地路由器"""
+
+    def __init__(self, labels: dict):
+        self.labels = labels  # 标签名 -> 描述文本
+        self._names = list(labels)
+        self._matrix = None   # 惰性计算：首次分类时才嵌入标签描述
+
+    def _label_matrix(self) -> np.ndarray:
+        if self._matrix is None:
+            self._matrix = np.stack([embed_text(desc) for desc in self.labels.values()])
+        return self._matrix
+
+    def classify(self, text: str):
+        """返回 (标签, 置信度)；嵌入服务不可用时返回 (None, 0.0)"""
+        try:
+            query_vector = embed_text(normalize_query(text))
+            similarities = self._label_matrix() @ query_vector
+        except Exception:
+            return None, 0.0
+        best = int(np.argmax(similarities))
+        return self._names[best], float(similarities[best])
+
+    async def aclassify(self, text: str):
+        """classify 的异步版本，不阻塞事件循环"""
+        try:
+            if self._matrix is None:
+                self._matrix = np.stack(
+                    [await aembed_text(desc) for desc in self.labels.values()]
+                )
+            query_vector = await aembed_text(normalize_query(text))
+            similarities = self._matrix @ query_vector
+        except Exception:
+            return None, 0.0
+        best = int(np.argmax(similarities))
+        return self._names[best], float(similarities[best])
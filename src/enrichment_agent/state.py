@@ -7,4 +7,5 @@ data model used internally by the graph.
 from langgraph.graph import MessagesState
 
 class AgentState(MessagesState):
-    next: str
\ No newline at end of file
+    next: str
+    plan: dict  # 顶层监督者一次性给出的 {team, worker} 分配计划
\ No newline at end of file
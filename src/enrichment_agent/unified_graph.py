@@ -3,93 +3,130 @@
 这个模块允许用户选择使用 Supervisor 架构或 Network 架构。
 """
 
-from enrichment_agent.graph import graph as supervisor_graph
-from enrichment_agent.network_graph import network_graph
-
-
-class GraphSelector:
-    """图选择器类，用于选择不同的多代理架构"""
-    
-    def __init__(self):
-        self.supervisor_graph = supervisor_graph
-        self.network_graph = network_graph
-    
-    def get_supervisor_graph(self):
-        """获取 Supervisor 架构的图"""
-        return self.supervisor_graph
-    
-    def get_network_graph(self):
-        """获取 Network 架构的图"""
-        return self.network_graph
-    
-    def compare_architectures(self):
-        """比较两种架构的特点"""
-        comparison = {
-            "Supervisor 架构": {
-                "特点": [
-                    "中央控制：有一个 supervisor 节点统一调度",
-                    "层次化：明确的上下级关系",
-                    "可预测：路由逻辑集中，容易理解和调试",
-                    "适用场景：有明确工作流程的任务"
-                ],
-                "优势": ["控制精确", "逻辑清晰", "易于维护"],
-                "劣势": ["中心化瓶颈", "灵活性较低"]
-            },
-            "Network 架构": {
-                "特点": [
-                    "去中心化：没有中央控制节点",
-                    "自主决策：每个 agent 独立决定下一步",
-                    "动态路由：agent 间可以自由通信",
-                    "适用场景：复杂的、非线性的任务流程"
-                ],
-                "优势": ["高度灵活", "适应性强", "无单点故障"],
-                "劣势": ["路由复杂", "可能出现死循环", "调试困难"]
-            }
-        }
-        return comparison
-
-
-# 创建全局选择器实例
-graph_selector = GraphSelector()
+import argparse
+import json
+import sys
+from functools import lru_cache
+
+# 架构对比是静态数据：构建一次，重复调用零分配。
+# 内层序列用 tuple，避免调用方改动共享对象
+_ARCHITECTURE_COMPARISON = {
+    "Supervisor 架构": {
+        "特点": (
+            "中央控制：有一个 supervisor 节点统一调度",
+            "层次化：明确的上下级关系",
+            "可预测：路由逻辑集中，容易理解和调试",
+            "适用场景：有明确工作流程的任务"
+        ),
+        "优势": ("控制精确", "逻辑清晰", "易于维护"),
+        "劣势": ("中心化瓶颈", "灵活性较低")
+    },
+    "Network 架构": {
+        "特点": (
+            "去中心化：没有中央控制节点",
+            "自主决策：每个 agent 独立决定下一步",
+            "动态路由：agent 间可以自由通信",
+            "适用场景：复杂的、非线性的任务流程"
+        ),
+        "优势": ("高度灵活", "适应性强", "无单点故障"),
+        "劣势": ("路由复杂", "可能出现死循环", "调试困难")
+    }
+}
+
+
+# GraphSelector 类已移除：选择器本身无状态，模块级函数 + 模块级
+# 惰性单例比实例属性少一层查找，也省掉单例对象本身。
+# 图模块仍在首次获取时才导入：只用一种架构的调用方不必在导入期
+# 付出另一种架构的 LLM 客户端、工具注册和图编译成本。
+_supervisor_graph = None
+_network_graph = None
+
+
+def get_supervisor_graph():
+    """获取 Supervisor 架构的图（惰性导入）"""
+    global _supervisor_graph
+    if _supervisor_graph is None:
+        from enrichment_agent.graph import graph
+        _supervisor_graph = graph
+    return _supervisor_graph
+
+
+def get_network_graph():
+    """获取 Network 架构的图（惰性导入）"""
+    global _network_graph
+    if _network_graph is None:
+        from enrichment_agent.network_graph import network_graph
+        _network_graph = network_graph
+    return _network_graph
+
+
+def compare_architectures():
+    """比较两种架构的特点"""
+    return _ARCHITECTURE_COMPARISON
+
+
+# 类型到获取函数的分发表：查表替代分支链，新增架构时注册一项即可
+_DISPATCH = {
+    "supervisor": get_supervisor_graph,
+    "network": get_network_graph,
+}
+
+
+@lru_cache(maxsize=4)
+def _resolve(graph_type_lower: str):
+    """解析类型字符串到图对象；lru_cache 让重复调用收敛为一次 C 层查表"""
+    return _DISPATCH.get(graph_type_lower, get_supervisor_graph)()
 
 
 def get_graph_by_type(graph_type="supervisor"):
     """根据类型获取相应的图
-    
+
     Args:
         graph_type (str): "supervisor" 或 "network"
-    
+
     Returns:
         相应的图对象
     """
-    if graph_type.lower() == "network":
-        return graph_selector.get_network_graph()
-    else:
-        return graph_selector.get_supervisor_graph()
+    return _resolve(graph_type.lower())
+
+
+# 演示文本是静态的：拼成一个常量，一次 write 输出，
+# 替代十几次各自加锁、格式化、刷新的 print 调用
+_DEMO_TEXT = """\
+=== Supervisor 架构演示 ===
+特点：中央 supervisor 节点统一调度
+使用方法（图带检查点，必须传 thread_id）：
+from enrichment_agent.unified_graph import get_graph_by_type
+supervisor_graph = get_graph_by_type('supervisor')
+config = {'configurable': {'thread_id': 'session-1'}}
+result = supervisor_graph.invoke({'messages': [user_message]}, config)
+
+=== Network 架构演示 ===
+特点：agent 之间自主决策，去中心化
+使用方法（图带检查点，必须传 thread_id）：
+from enrichment_agent.unified_graph import get_graph_by_type
+network_graph = get_graph_by_type('network')
+config = {'configurable': {'thread_id': 'session-1'}}
+result = network_graph.invoke({'messages': [user_message]}, config)
+"""
 
 
 def demo_both_graphs():
     """演示两种图的使用方法"""
-    print("=== Supervisor 架构演示 ===")
-    print("特点：中央 supervisor 节点统一调度")
-    print("使用方法：")
-    print("from enrichment_agent.unified_graph import get_graph_by_type")
-    print("supervisor_graph = get_graph_by_type('supervisor')")
-    print("result = supervisor_graph.invoke({'messages': [user_message]})")
-    
-    print("\n=== Network 架构演示 ===")
-    print("特点：agent 之间自主决策，去中心化")
-    print("使用方法：")
-    print("from enrichment_agent.unified_graph import get_graph_by_type")
-    print("network_graph = get_graph_by_type('network')")
-    print("result = network_graph.invoke({'messages': [user_message]})")
+    sys.stdout.write(_DEMO_TEXT)
 
 
 if __name__ == "__main__":
-    demo_both_graphs()
-    print("\n=== 架构对比 ===")
-    comparison = graph_selector.compare_architectures()
-    for arch_name, details in comparison.items():
-        print(f"\n{arch_name}:")
-        for key, value in details.items():
-            print(f"  {key}: {value}")
\ No newline at end of file
+    # 不带参数时什么都不做：演示/对比输出只在显式要求时产生，
+    # 避免 CI 或导入分析工具跑到这里时白付输出成本
+    parser = argparse.ArgumentParser(description="多代理架构选择器演示")
+    parser.add_argument("--demo", action="store_true", help="打印两种架构的使用演示")
+    parser.add_argument("--compare", action="store_true", help="打印架构对比")
+    args = parser.parse_args()
+
+    if args.demo:
+        demo_both_graphs()
+    if args.compare:
+        # json.dumps 的 C 层序列化替代逐项的 Python 嵌套循环
+        print("=== 架构对比 ===")
+        print(json.dumps(_ARCHITECTURE_COMPARISON, ensure_ascii=False, indent=2))
\ No newline at end of file